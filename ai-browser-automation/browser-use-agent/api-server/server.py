@@ -1,8 +1,14 @@
+import asyncio
+import contextlib
+import glob
 import os
+import shutil
 import sys
-import subprocess
+import uuid
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Security, status
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.security import APIKeyHeader
 import ngrok
 import uvicorn
@@ -17,13 +23,27 @@ load_dotenv()
 NGROK_TOKEN = os.getenv("NGROK_AUTH_TOKEN")
 APP_KEY = os.getenv("APP_API_KEY")
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+# Job log tails can be large; compress them on the way through the tunnel
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# Cap how many agent runs can be in flight at once
+MAX_CONCURRENT_TASKS = 2
+task_semaphore = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
+
+# Agent output goes to one log file per job instead of through pipes
+LOG_DIR = os.path.join(current_dir, "logs")
+LOG_TAIL_BYTES = 16 * 1024
+# Finished jobs (and their log files) kept around for /run/{job_id}; older ones are dropped
+MAX_FINISHED_JOBS = 50
+PYTHON = shutil.which("python3") or sys.executable
+jobs = {}
 
 # 2. Define the security header requirement
 # This tells FastAPI to look for a header named "X-API-KEY"
 api_key_header = APIKeyHeader(name="X-API-KEY", auto_error=False)
 
-def get_api_key(api_key: str = Security(api_key_header)):
+async def get_api_key(api_key: str = Security(api_key_header)):
     if api_key == APP_KEY:
         return api_key
     raise HTTPException(
@@ -31,35 +51,123 @@ def get_api_key(api_key: str = Security(api_key_header)):
         detail="Invalid or missing API Key",
     )
 
+def read_log_tail(log_path):
+    with open(log_path, "rb") as f:
+        f.seek(max(os.path.getsize(log_path) - LOG_TAIL_BYTES, 0))
+        return f.read().decode(errors="replace")
+
+def prune_logs(keep):
+    # keep the newest MAX_FINISHED_JOBS logs plus any in `keep` (running jobs)
+    logs = []
+    for path in glob.glob(os.path.join(LOG_DIR, "*.log")):
+        with contextlib.suppress(FileNotFoundError):
+            logs.append((os.path.getmtime(path), path))
+    logs.sort(reverse=True)
+    for _, path in logs[MAX_FINISHED_JOBS:]:
+        if path not in keep:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+@app.on_event("startup")
+async def prepare_logs():
+    await asyncio.to_thread(os.makedirs, LOG_DIR, exist_ok=True)
+    await asyncio.to_thread(prune_logs, set())
+
 # 3. Secure your ngrok connection
-# We pass the token explicitly so it's not hardcoded
-ngrok.set_auth_token(NGROK_TOKEN)
-public_url = ngrok.connect(8000)
-print(f"ngrok tunnel opened at {public_url}")
+# We pass the token explicitly so it's not hardcoded.
+# The tunnel lives with the server process, so importing this module doesn't open one.
+@app.on_event("startup")
+async def open_tunnel():
+    ngrok.set_auth_token(NGROK_TOKEN)
+    # run the blocking connect off the event loop
+    app.state.tunnel = await asyncio.to_thread(ngrok.connect, 8000)
+    print(f"ngrok tunnel opened at {app.state.tunnel.url()}")
+
+@app.on_event("shutdown")
+async def close_tunnel():
+    tunnel = getattr(app.state, "tunnel", None)
+    if tunnel is not None:
+        await asyncio.to_thread(ngrok.disconnect, tunnel.url())
 
 @app.get("/")
-def read_root(api_key: str = Security(get_api_key)):
+async def read_root(api_key: str = Security(get_api_key)):
     """
     This route is now protected. 
     You must provide X-API-KEY in your headers to see this message.
     """
     return {"message": "Hello, World!", "status": "Authenticated"}
 
+async def wait_for_job(proc):
+    try:
+        await proc.wait()
+    finally:
+        task_semaphore.release()
+    # jobs is insertion ordered, so this evicts the oldest finished jobs first
+    finished = [job_id for job_id, job in jobs.items() if job["proc"].returncode is not None]
+    for job_id in finished[:-MAX_FINISHED_JOBS]:
+        del jobs[job_id]
+    running = {job["log_path"] for job in jobs.values() if job["proc"].returncode is None}
+    await asyncio.to_thread(prune_logs, running)
+
 @app.get("/run")
-def run_task(api_key: str = Security(get_api_key)):
+async def run_task(api_key: str = Security(get_api_key)):
     """
-    An example endpoint that could trigger some task.
+    Starts the agent script in the background and returns its job id.
+    Poll /run/{job_id} for the status and the tail of its log.
     """
     # Here you would add the logic to run your specific task
     script_path = os.path.join(parent_dir, "reddit-browser-agent.py")
-    # os.system(f"python3 {script_path}")
-    # return {"message": "Task executed successfully!", "status": "Authenticated"}
+    if task_semaphore.locked():
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many tasks running, try again later",
+        )
+    await task_semaphore.acquire()
+    job_id = uuid.uuid4().hex
+    log_path = os.path.join(LOG_DIR, f"{job_id}.log")
+    try:
+        log_file = await asyncio.to_thread(open, log_path, "ab")
+        try:
+            # start_new_session detaches the agent from the server's process group so
+            # a Ctrl-C on the server doesn't kill it; close_fds keeps server sockets and
+            # files out of the child. The child keeps its own copy of the log fd.
+            proc = await asyncio.create_subprocess_exec(
+                PYTHON, script_path,
+                stdout=log_file,
+                stderr=log_file,
+                close_fds=True,
+                start_new_session=True,
+            )
+        finally:
+            log_file.close()
+    except Exception:
+        task_semaphore.release()
+        raise
+    jobs[job_id] = {"proc": proc, "log_path": log_path, "waiter": asyncio.create_task(wait_for_job(proc))}
+    return {"message": "Task started", "job_id": job_id}
+
+@app.get("/run/{job_id}")
+async def task_status(job_id: str, api_key: str = Security(get_api_key)):
+    """
+    Reports whether a job is still running and returns the tail of its log.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown job id")
+    returncode = job["proc"].returncode
+    if returncode is None:
+        message = "Task running"
+    elif returncode == 0:
+        message = "Task executed successfully!"
+    else:
+        message = "Task execution failed!"
     try:
-        result = subprocess.run(["python3", script_path], capture_output=True, text=True, check=True)
-        return {"message": "Task executed successfully!", "output": result.stdout}
-    except subprocess.CalledProcessError as e:
-        return {"message": "Task execution failed!", "error": e.stderr}
+        output = await asyncio.to_thread(read_log_tail, job["log_path"])
+    except FileNotFoundError:
+        output = ""
+    return {"message": message, "job_id": job_id, "returncode": returncode, "output": output}
 
 if __name__ == "__main__":
     # uvicorn.run("main:app", host="0.0.0.0", port=8000)
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # uvloop + httptools come with uvicorn[standard]
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools", log_level="warning")
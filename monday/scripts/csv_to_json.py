@@ -1,7 +1,7 @@
 import json
 import csv
 
-def to_json(csvFilePath, jsonFilePath):
+def to_json(csvFilePath, jsonFilePath=None):
     data = {}
     with open(csvFilePath, encoding='utf-8') as csvf:
         csvReader = csv.DictReader(csvf)
@@ -13,13 +13,16 @@ def to_json(csvFilePath, jsonFilePath):
             else:
                 count += 1
                 data[count] = rows
-    with open(jsonFilePath, 'w', encoding='utf-8') as jsonf:
-        jsonf.write(json.dumps(data, indent=4))
+    if jsonFilePath:
+        with open(jsonFilePath, 'w', encoding='utf-8') as jsonf:
+            jsonf.write(json.dumps(data, indent=4))
+    return data
 
-def to_csv(csvFilePath, jsonFilePath):
-    data = {}
-    with open(jsonFilePath, 'r', encoding='utf-8') as jsonf:
-        data = json.load(jsonf)
+def to_csv(csvFilePath, jsonFilePath=None, data=None):
+    # pass data directly to skip the JSON file round trip
+    if data is None:
+        with open(jsonFilePath, 'r', encoding='utf-8') as jsonf:
+            data = json.load(jsonf)
     data_list = list(data.values())
     csv_columns = data_list[0].keys()
     with open(csvFilePath, 'w', encoding='utf-8') as csvf:
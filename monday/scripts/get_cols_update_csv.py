@@ -1,64 +1,221 @@
-import requests
-import json
+import asyncio
+import httpx
+import orjson
 import os
+from cachetools import TTLCache
+from itertools import islice
 from automation.monday.scripts.csv_to_json import to_json, to_csv
 
-def get_update_json(headers, url, lead_info, lead_email, search_col, board_id):
-    query = """
-        query ($board_id: ID!, $email: String!, $column_id: String!) {
-            items_page_by_column_values(limit: 5, board_id: $board_id, columns: [{column_id: $column_id, column_values: [$email]}]) {
+# (search column, board) pairs tried in order until a lead is found
+LOOKUPS = (
+    ("lead_email", 6322035430),
+    ("personal_email__1", 6322035430),
+    ("lead_email", 6490395247),
+)
+NOT_FOUND = "Not Found"
+# Marks leads whose lookup failed (HTTP/GraphQL error) rather than came back empty
+LOOKUP_ERROR = "Error"
+
+# Retries for rate limiting (429) and transient 5xx/network failures
+MAX_ATTEMPTS = 4
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Lookup results are cached per (board, column, email). Redis is used when
+# REDIS_URL is set so results survive between runs; otherwise an in-process cache.
+REDIS_URL = os.environ.get("REDIS_URL")
+CACHE_TTL = 86400
+# misses expire sooner so leads added to Monday later are picked up on re-runs
+NEGATIVE_CACHE_TTL = 900
+_local_cache = TTLCache(maxsize=10_000, ttl=3600)
+_redis = None
+_redis_errors = ()  # set to (redis.RedisError,) once redis is imported
+_MISS = object()
+
+# Number of lead lookups packed into a single aliased GraphQL request
+BATCH_SIZE = 25
+
+# Lead field -> Monday column id. Values are read by id, never by position,
+# since Monday doesn't guarantee column_values come back in request order.
+# Same mapping as export_contacts.py (reads) and update_on_leads2.py / update_on_crm.py
+# (writes): company lives in "lead_company", title in the board's "text" column.
+ENRICH_COLUMNS = {
+    "Company": "lead_company",
+    "Title": "text",
+    "Linkedin Profile": "linkedin_profile__1",
+}
+# Fields only filled from Monday when the lead sheet leaves them empty
+KEEP_EXISTING = {"Company"}
+
+# column_values ids must match ENRICH_COLUMNS
+LOOKUP_FIELDS = """
                 cursor
                 items {
                     id
                     name
-                    column_values(ids: ["text", "lead_company", "linkedin_profile__1"]) {
+                    column_values(ids: ["lead_company", "text", "linkedin_profile__1"]) {
                         id
                         value
                         }
                     }
-                }
-            }
+"""
+
+def batched(items, size):
+    it = iter(items)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+def build_batch_query(count):
+    email_vars = ", ".join(f"$email{n}: String!" for n in range(count))
+    lookups = "".join(
+        f"""
+            l{n}: items_page_by_column_values(limit: 5, board_id: $board_id, columns: [{{column_id: $column_id, column_values: [$email{n}]}}]) {{{LOOKUP_FIELDS}                }}"""
+        for n in range(count)
+    )
+    return f"""
+        query ($board_id: ID!, $column_id: String!, {email_vars}) {{{lookups}
+            }}
         """
- 
+
+def decode_value(value):
+    """Monday returns column values JSON-encoded; unwrap plain strings, keep anything else as-is."""
+    if not value:
+        return ""
+    decoded = orjson.loads(value)
+    return decoded if isinstance(decoded, str) else value
+
+def cache_key(board_id, search_col, email):
+    return f"monday:{board_id}:{search_col}:{email}"
+
+async def cache_get_many(keys):
+    # one MGET per batch rather than a round trip per lead
+    if _redis is not None:
+        try:
+            raws = await _redis.mget(keys)
+        except _redis_errors as e:
+            # a cache outage shouldn't stop enrichment; treat it as all misses
+            print(f"Cache read failed, querying Monday instead: {e!r}")
+            return [_MISS] * len(keys)
+        return [_MISS if raw is None else orjson.loads(raw) for raw in raws]
+    return [_local_cache.get(key, _MISS) for key in keys]
+
+async def cache_set_many(entries):
+    # entries are (key, row) pairs; row is None for "no match", cached with a shorter TTL
+    if _redis is not None:
+        try:
+            async with _redis.pipeline(transaction=False) as pipe:
+                for key, row in entries:
+                    pipe.setex(key, CACHE_TTL if row is not None else NEGATIVE_CACHE_TTL, orjson.dumps(row))
+                await pipe.execute()
+        except _redis_errors as e:
+            print(f"Cache write failed, skipping: {e!r}")
+    else:
+        for key, row in entries:
+            _local_cache[key] = row
+
+def apply_row(lead_info, row):
+    if row is None:
+        # an earlier failed lookup stays visible unless a later pass finds the lead
+        if lead_info.get("Temp") != LOOKUP_ERROR:
+            lead_info["Temp"] = NOT_FOUND
+        print("No luck here")
+        return
+    cv = {c['id']: c['value'] for c in row['column_values']}
+    lead_info["Name"] = row['name']
+    for field, column_id in ENRICH_COLUMNS.items():
+        if field in KEEP_EXISTING and lead_info.get(field):
+            continue
+        lead_info[field] = decode_value(cv.get(column_id))
+    lead_info["Temp"] = "Found"
+    print("We have a live one!")
+
+def mark_error(leads, reason):
+    print(f"Error looking up {len(leads)} leads: {reason}")
+    for lead_email, lead_info in leads:
+        lead_info["Temp"] = LOOKUP_ERROR
+
+async def post_with_retry(client, url, data, headers):
+    """Posts a GraphQL document, backing off on 429/5xx and network errors. Returns the
+    parsed body, or None after logging why the request failed."""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        response = None
+        try:
+            response = await client.post(url, json=data, headers=headers)
+        except httpx.TransportError as e:
+            reason = repr(e)
+        else:
+            if response.status_code == 200:
+                try:
+                    return orjson.loads(response.content)
+                except orjson.JSONDecodeError:
+                    print(f"Non-JSON response: {response.text[:200]}")
+                    return None
+            reason = f"HTTP {response.status_code}: {response.text[:200]}"
+            if response.status_code not in RETRY_STATUSES:
+                print(reason)
+                return None
+        if attempt == MAX_ATTEMPTS:
+            break
+        delay = 2 ** attempt
+        if response is not None and response.headers.get("Retry-After", "").isdigit():
+            delay = int(response.headers["Retry-After"])
+        print(f"{reason}; retrying in {delay}s")
+        await asyncio.sleep(delay)
+    print(f"Giving up after {MAX_ATTEMPTS} attempts: {reason}")
+    return None
+
+async def get_update_json(client, headers, url, leads, search_col, board_id):
+    """Looks up a batch of (lead_email, lead_info) pairs on one board in a single request."""
+    uncached = []
+    keys = [cache_key(board_id, search_col, lead_info['email']) for lead_email, lead_info in leads]
+    for (lead_email, lead_info), row in zip(leads, await cache_get_many(keys)):
+        if row is _MISS:
+            uncached.append((lead_email, lead_info))
+        else:
+            apply_row(lead_info, row)
+    if not uncached:
+        return
+
     variables = {
         'board_id': str(board_id),
         'column_id': str(search_col),
-        'email': lead_info['email']
     }
+    for n, (lead_email, lead_info) in enumerate(uncached):
+        variables[f'email{n}'] = lead_info['email']
 
     data = {
-        "query": query,
+        "query": build_batch_query(len(uncached)),
         "variables": variables
     }
 
-    response = requests.post(url, json=data, headers=headers)
-    data = response.json()
-    if response.status_code == 200:
-        try:
-            lead_info["Name"] = str(data['data']['items_page_by_column_values']['items'][0]['name']).strip('"')
-            if lead_info["Company"] == "" or not lead_info["Company"]:
-                lead_info["Company"] = str(data['data']['items_page_by_column_values']['items'][0]['column_values'][0]['value']).strip('"')
-            lead_info["Title"] = str(data['data']['items_page_by_column_values']['items'][0]['column_values'][1]['value']).strip('"')
-            lead_info["Linkedin Profile"] = str(data['data']['items_page_by_column_values']['items'][0]['column_values'][2]['value']).strip('"')
-            lead_info["Temp"] = "Found"
-            print("We have a live one!")
-            # item_id = str(data['data']['items_page_by_column_values']['items'][0]['column_values'])
-            # print(item_id)
-        except IndexError:
-            if search_col == "lead_email" and board_id == 6322035430:
-                get_update_json(headers, url, lead_info, lead_email, "personal_email__1", 6322035430)
-            else:
-                lead_info["Temp"] = "Not Found"
-                print("No luck here")
-                return     
-    else:
-        print("Error")
+    data = await post_with_retry(client, url, data, headers)
+    if data is None:
+        mark_error(uncached, "request failed")
         return
+    if data.get("errors"):
+        # may be partial: aliases that failed come back null, the rest still have data
+        print(f"GraphQL errors: {data['errors']}")
+    results = data.get("data") or {}
+    fetched = []
+    for n, (lead_email, lead_info) in enumerate(uncached):
+        page = results.get(f'l{n}')
+        if page is None:
+            mark_error([(lead_email, lead_info)], f"no result for {lead_info['email']}")
+            continue
+        items = page['items']
+        row = items[0] if items else None
+        fetched.append((cache_key(board_id, search_col, lead_info['email']), row))
+        apply_row(lead_info, row)
+    if fetched:
+        await cache_set_many(fetched)
 
-def main():
-    to_json("leads.csv", "leads_to_enrich.json")
-    with open("leads_to_enrich.json", "r") as leads_json:
-        leads_data = json.load(leads_json)
+async def main():
+    global _redis, _redis_errors
+    if REDIS_URL:
+        import redis
+        import redis.asyncio as aioredis
+        _redis = aioredis.from_url(REDIS_URL)
+        _redis_errors = (redis.RedisError,)
+    leads_data = to_json("leads.csv")
     api_key = os.environ.get("MONDAY_API_KEY")
     url = "https://api.monday.com/v2"
     headers = {
@@ -67,16 +224,36 @@ def main():
         'API-Version': '2025-10'
     }
     print("\n")
-    count = 0
-    for i in leads_data:
-        count += 1
-        print(f"Processing lead {count}")
-        get_update_json(headers, url, leads_data[i], i, "lead_email", 6322035430)
-        if leads_data[i]["Temp"] == "Not Found":
-            get_update_json(headers, url, leads_data[i], i, "lead_email", 6490395247)
-    with open("leads_to_enrich.json", "w") as leads_json:
-        json.dump(leads_data, leads_json, indent=4)
-    to_csv("leads.csv", "leads_to_enrich.json")
+    # One pooled client so every lookup reuses the same TLS connections
+    limits = httpx.Limits(max_keepalive_connections=20, max_connections=20)
+    semaphore = asyncio.Semaphore(10)
+
+    async def process(batch, search_col, board_id):
+        async with semaphore:
+            await get_update_json(client, headers, url, batch, search_col, board_id)
+
+    async def lookup_pass(leads, search_col, board_id):
+        # Batches of one pass are in flight together; passes run in order
+        # because each one only retries the leads the previous one missed.
+        print(f"Looking up {len(leads)} leads by {search_col} on board {board_id}")
+        await asyncio.gather(*(process(batch, search_col, board_id) for batch in batched(leads, BATCH_SIZE)))
+
+    try:
+        async with httpx.AsyncClient(limits=limits, http2=True, timeout=30) as client:
+            # clear markers left in the CSV by a previous run
+            for lead in leads_data.values():
+                lead["Temp"] = ""
+            pending = list(leads_data.items())
+            for search_col, board_id in LOOKUPS:
+                if not pending:
+                    break
+                await lookup_pass(pending, search_col, board_id)
+                # failed lookups are retried on the remaining boards too
+                pending = [(i, lead) for i, lead in pending if lead.get("Temp") in (NOT_FOUND, LOOKUP_ERROR)]
+    finally:
+        if _redis is not None:
+            await _redis.aclose()
+    to_csv("leads.csv", data=leads_data)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
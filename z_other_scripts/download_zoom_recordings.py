@@ -1,9 +1,17 @@
 #!/usr/bin/env python3
 # zoom_simple.py
 import base64
+import os
 import pathlib
 import re
+import shutil
+import sys
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, date, timedelta
 
 # ------------------ FILL THESE ------------------
@@ -18,33 +26,70 @@ OUT_DIR      = "[SET UP OUTPUT DIRECTORY HERE]"
 
 API_BASE = "https://api.zoom.us/v2"
 OAUTH_URL = "https://zoom.us/oauth/token"
+MAX_WORKERS = 6  # concurrent downloads; keep <= pool_maxsize below
 
-def get_token() -> str:
+# one pooled session so pagination and downloads reuse connections
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]),
+))
+
+def get_token() -> tuple[str, float]:
     auth = base64.b64encode(f"{CLIENT_ID}:{CLIENT_SECRET}".encode()).decode()
-    r = requests.post(
+    r = SESSION.post(
         OAUTH_URL,
         headers={"Authorization": f"Basic {auth}"},
         params={"grant_type": "account_credentials", "account_id": ACCOUNT_ID},
         timeout=30,
     )
     r.raise_for_status()
-    return r.json()["access_token"]
+    body = r.json()
+    # refresh a minute early so in-flight requests don't race the expiry
+    expires_at = time.monotonic() + body.get("expires_in", 3600) - 60
+    return body["access_token"], expires_at
+
+# tokens last ~1 hour, so share one across listing and all download threads
+_TOKEN = {"val": None, "exp": 0.0}
+_TOKEN_LOCK = threading.Lock()
+
+def cached_token() -> str:
+    with _TOKEN_LOCK:
+        if _TOKEN["val"] is None or time.monotonic() >= _TOKEN["exp"]:
+            _TOKEN["val"], _TOKEN["exp"] = get_token()
+        return _TOKEN["val"]
+
+def invalidate_token(failed: str):
+    # only drop the cache if nobody has refreshed it since `failed` was handed out,
+    # so a burst of 401s from threads holding the same old token costs one refresh
+    with _TOKEN_LOCK:
+        if _TOKEN["val"] == failed:
+            _TOKEN["exp"] = 0.0
+
+_BAD_CHARS = re.compile(r"[\/\\\?\%\*\:\|\"<>\x00-\x1F]")
+_WHITESPACE = re.compile(r"\s+")
 
 def sanitize(name: str, max_len: int = 150) -> str:
-    name = re.sub(r"[\/\\\?\%\*\:\|\"<>\x00-\x1F]", "_", name)
-    name = re.sub(r"\s+", " ", name).strip()
-    return name[:max_len]
+    return _WHITESPACE.sub(" ", _BAD_CHARS.sub("_", name)).strip()[:max_len]
 
-def next_unique_path(path: pathlib.Path) -> pathlib.Path:
-    if not path.exists():
+def next_unique_path(path: pathlib.Path, claimed: set = frozenset()) -> pathlib.Path:
+    # claimed holds paths handed out for downloads that may not exist on disk yet
+    if not path.exists() and path not in claimed:
         return path
     i = 2
     while True:
         p = path.with_name(f"{path.stem}-{i}{path.suffix}")
-        if not p.exists():
+        if not p.exists() and p not in claimed:
             return p
         i += 1
 
+def meeting_date(start_time: str) -> date:
+    # Zoom start_time is UTC with a trailing Z, e.g. 2024-05-01T14:30:00Z
+    if sys.version_info >= (3, 11):
+        return datetime.fromisoformat(start_time).date()
+    return datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%SZ").date()
+
 def first_of_month(d: date) -> date:
     return d.replace(day=1)
 
@@ -59,41 +104,50 @@ def month_windows(start_d: date, end_d: date):
         yield cur.isoformat(), window_end.isoformat()
         cur = next_first
 
-def list_records(token: str, user_id: str, f: str, t: str):
+def list_records(user_id: str, f: str, t: str):
     url = f"{API_BASE}/users/{user_id}/recordings"
     params = {"from": f, "to": t, "page_size": 300}
     next_page = None
     while True:
         if next_page:
             params["next_page_token"] = next_page
-        r = requests.get(url, headers={"Authorization": f"Bearer {token}"}, params=params, timeout=60)
+        token = cached_token()
+        r = SESSION.get(url, headers={"Authorization": f"Bearer {token}"}, params=params, timeout=60)
         # if token expired, fetch a fresh one once and retry this page
         if r.status_code == 401:
-            token = get_token()
-            r = requests.get(url, headers={"Authorization": f"Bearer {token}"}, params=params, timeout=60)
+            invalidate_token(token)
+            token = cached_token()
+            r = SESSION.get(url, headers={"Authorization": f"Bearer {token}"}, params=params, timeout=60)
         r.raise_for_status()
         data = r.json()
         for m in data.get("meetings", []):
-            yield m, token  # return token so caller keeps latest
+            yield m
         next_page = data.get("next_page_token")
         if not next_page:
             break
 
-def download(url: str, dest: pathlib.Path, token: str):
+def download(url: str, dest: pathlib.Path):
     sep = "&" if "?" in url else "?"
-    new_url = f"{url}{sep}access_token={token}"
     tmp = dest.with_suffix(dest.suffix + ".part")
-    with requests.get(new_url, stream=True, timeout=120) as r:
-        if r.status_code == 401:
-            # simplest path: bail; re-run script to continue
-            token = get_token()
-            download(url, dest, token)
-            raise RuntimeError("Token expired during download. Re-run the script.")
-        r.raise_for_status()
+    for attempt in (0, 1):
+        # read the shared token when the download actually starts, not when it was queued
+        token = cached_token()
+        r = SESSION.get(f"{url}{sep}access_token={token}", stream=True, timeout=120)
+        if r.status_code == 401 and attempt == 0:
+            # token expired mid-run: refresh once and retry this file
+            r.close()
+            invalidate_token(token)
+            continue
+        if not r.ok:
+            r.close()  # hand the pooled connection back before raising
+            r.raise_for_status()
+        break
+    with r:
+        r.raw.decode_content = True
         with open(tmp, "wb") as f:
-            for chunk in r.iter_content(chunk_size=2 * 1024 * 1024):
-                if chunk:
-                    f.write(chunk)
+            if hasattr(os, "posix_fadvise"):  # Linux only
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            shutil.copyfileobj(r.raw, f, length=1 << 20)
     if tmp.stat().st_size == 0:
         tmp.unlink(missing_ok=True)
         raise RuntimeError("Downloaded zero bytes.")
@@ -106,29 +160,46 @@ def main():
     start_d = datetime.fromisoformat(FROM_DATE).date()
     end_d   = datetime.fromisoformat(TO_DATE).date()
 
-    token = get_token()
-
-    for f, t in month_windows(start_d, end_d):
-        for meeting, token in list_records(token, USER_ID, f, t):
-            topic = sanitize(meeting.get("topic", "Untitled"))
-            new_token = get_token()  # ensure fresh token for downloads
-            # use UTC date from start_time
-            dt = datetime.fromisoformat(meeting["start_time"].replace("Z", "+00:00")).date()
-            folder = base / f"xRecording - {topic} - {dt.isoformat()}"
-            folder.mkdir(parents=True, exist_ok=True)
-
-            for rf in meeting.get("recording_files", []) or []:
-                rtype = str(rf.get("recording_type", "file")).lower().replace(" ", "_")
-                ext   = str(rf.get("file_extension") or rf.get("file_type") or "dat").lower()
-                dest  = next_unique_path(folder / sanitize(f"{rtype}.{ext}"))
-
-                dl = rf.get("download_url")
-                if not dl:
-                    print(f"[skip] no download_url: {dest.name}")
-                    continue
-
-                print(f"[get] {folder.name} -> {dest.name}")
-                download(dl, dest, new_token)
+    claimed = set()
+    failed = 0
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {}  # future -> dest, so failures can be reported by file
+        try:
+            for f, t in month_windows(start_d, end_d):
+                for meeting in list_records(USER_ID, f, t):
+                    topic = sanitize(meeting.get("topic", "Untitled"))
+                    # use UTC date from start_time
+                    dt = meeting_date(meeting["start_time"])
+                    folder = base / f"xRecording - {topic} - {dt.isoformat()}"
+                    folder.mkdir(parents=True, exist_ok=True)
+
+                    for rf in meeting.get("recording_files", []) or []:
+                        rtype = str(rf.get("recording_type", "file")).lower().replace(" ", "_")
+                        ext   = str(rf.get("file_extension") or rf.get("file_type") or "dat").lower()
+                        dest  = next_unique_path(folder / sanitize(f"{rtype}.{ext}"), claimed)
+
+                        dl = rf.get("download_url")
+                        if not dl:
+                            print(f"[skip] no download_url: {dest.name}")
+                            continue
+
+                        claimed.add(dest)
+                        print(f"[get] {folder.name} -> {dest.name}")
+                        futures[executor.submit(download, dl, dest)] = dest
+
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"[fail] {futures[future]}: {e}")
+        except BaseException:
+            # listing failed or Ctrl-C: drop queued downloads instead of waiting on them
+            executor.shutdown(cancel_futures=True)
+            raise
+
+    if failed:
+        sys.exit(f"{failed} download(s) failed")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file